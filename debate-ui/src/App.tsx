@@ -130,6 +130,7 @@ function App() {
     const [error, setError] = useState<string | null>(null);
 
     const transcriptRef = useRef<HTMLDivElement | null>(null);
+    const sessionIdRef = useRef<string>(createId());
 
     const lastMessage = messages[messages.length - 1];
     const transcriptMessages = lastMessage ? messages.slice(0, -1) : messages;
@@ -164,7 +165,8 @@ function App() {
     const requestTurn = useCallback(async (speaker: Speaker, contextMessage: string) => {
         const payload = {
             speaker,
-            message: contextMessage
+            message: contextMessage,
+            session_id: sessionIdRef.current
         };
         setIsLoading(true);
         setError(null);
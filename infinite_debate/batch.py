@@ -0,0 +1,126 @@
+"""
+batch.py - Debates offline a traves de la Batch API de Groq (compatible con OpenAI)
+
+- Cada lote contiene la replica de un personaje para todos los debates en el turno actual
+- Dentro de un debate los turnos siguen siendo secuenciales; solo se paraleliza entre debates
+- Pensado para evaluaciones y replays: menor coste por token, pero cada lote puede tardar hasta 24h
+"""
+
+import json
+import random
+import time
+from typing import Dict, List, Tuple
+
+from infinite_debate.client import GROQ_MODEL, get_groq
+from infinite_debate.main import (
+    MAX_TOKENS,
+    SYS_PROMPTS,
+    MemoriaDebate,
+    _construir_mensajes,
+    _mensaje_contexto,
+    _temperatura,
+    extraer_metricas,
+    postprocesar,
+)
+
+ENDPOINT = "/v1/chat/completions"
+# Sondeo del estado del lote: backoff exponencial con jitter y tope, para que varios procesos
+# lanzados a la vez no consulten sincronizados
+SONDEO_INICIAL = 5.0  # segundos
+SONDEO_MAXIMO = 60.0  # segundos
+ESTADOS_FINALES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _peticion(custom_id: str, personaje: str, mensaje: str, evitacion: str = "") -> Dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": GROQ_MODEL,
+            "messages": _construir_mensajes(SYS_PROMPTS[personaje], _mensaje_contexto(mensaje, evitacion), None),
+            "temperature": _temperatura(personaje),
+            "max_tokens": MAX_TOKENS,
+            "presence_penalty": 0.2,
+            "frequency_penalty": 0.2,
+        },
+    }
+
+
+def _leer_jsonl(client, file_id: str) -> List[Dict]:
+    return [json.loads(linea) for linea in client.files.content(file_id).text().splitlines() if linea.strip()]
+
+
+def _ejecutar_lote(peticiones: List[Dict]) -> Dict[str, str]:
+    client = get_groq()
+    jsonl = "\n".join(json.dumps(p, ensure_ascii=False) for p in peticiones)
+    archivo = client.files.create(file=("debate_batch.jsonl", jsonl.encode("utf-8")), purpose="batch")
+    lote = client.batches.create(
+        input_file_id=archivo.id,
+        endpoint=ENDPOINT,
+        completion_window="24h",
+    )
+
+    espera = SONDEO_INICIAL
+    while lote.status not in ESTADOS_FINALES:
+        time.sleep(espera * random.uniform(0.5, 1.5))
+        espera = min(espera * 2, SONDEO_MAXIMO)
+        lote = client.batches.retrieve(lote.id)
+
+    if lote.status != "completed":
+        raise RuntimeError(f"El lote {lote.id} termino con estado {lote.status}.")
+
+    resultados: Dict[str, str] = {}
+    if lote.output_file_id:
+        for item in _leer_jsonl(client, lote.output_file_id):
+            respuesta = item.get("response") or {}
+            try:
+                contenido = respuesta["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                contenido = None
+            if not contenido or not contenido.strip():
+                raise RuntimeError(f"Groq no devolvio respuesta para {item.get('custom_id')}: {item.get('error')}")
+            resultados[item["custom_id"]] = contenido.strip()
+
+    # Las peticiones que fallan dentro de un lote completado van al fichero de errores, no al de salida
+    faltan = [p["custom_id"] for p in peticiones if p["custom_id"] not in resultados]
+    if faltan:
+        errores: Dict[str, object] = {}
+        if lote.error_file_id:
+            for item in _leer_jsonl(client, lote.error_file_id):
+                cuerpo = (item.get("response") or {}).get("body") or {}
+                errores[item.get("custom_id")] = item.get("error") or cuerpo.get("error")
+        detalle = "; ".join(f"{cid}: {errores.get(cid, 'sin respuesta')}" for cid in faltan)
+        raise RuntimeError(f"Groq no devolvio respuesta en el lote {lote.id} para {detalle}")
+    return resultados
+
+
+def run_debate_batch(mensajes_iniciales: List[str], turnos: int = 3) -> List[List[Tuple[str, str]]]:
+    # Misma transcripcion que debate_async, pero cada replica de todos los debates viaja en un lote.
+    # Cada debate lleva su MemoriaDebate para la pista de evitacion, como en debate_async.
+    # Como en generar_respuesta, las respuestas cortas se rellenan en postprocesar.
+    transcripciones: List[List[Tuple[str, str]]] = [[("cheah", m)] for m in mensajes_iniciales]
+    mensajes = list(mensajes_iniciales)
+    memorias = [MemoriaDebate() for _ in mensajes_iniciales]
+    for memoria, mensaje in zip(memorias, mensajes_iniciales):
+        memoria.registrar_metricas("cheah", extraer_metricas(mensaje))
+
+    for turno in range(turnos):
+        for personaje in ("buffett", "cheah"):
+            peticiones = [
+                _peticion(
+                    f"{debate_id}:{turno}:{personaje}",
+                    personaje,
+                    mensaje,
+                    memorias[debate_id].obtener_contexto_evitacion(personaje),
+                )
+                for debate_id, mensaje in enumerate(mensajes)
+            ]
+            resultados = _ejecutar_lote(peticiones)
+            for debate_id, peticion in enumerate(peticiones):
+                respuesta = postprocesar(resultados[peticion["custom_id"]], personaje)
+                memorias[debate_id].registrar_metricas(personaje, extraer_metricas(respuesta))
+                transcripciones[debate_id].append((personaje, respuesta))
+                mensajes[debate_id] = respuesta
+
+    return transcripciones
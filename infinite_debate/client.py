@@ -0,0 +1,57 @@
+"""
+client.py - Clientes Groq compartidos para Infinite Debate
+
+- get_groq / get_async_groq construyen el cliente la primera vez que se piden y luego lo reutilizan
+- Cada cliente del SDK mantiene su propio pool httpx: compartirlo conserva las conexiones TLS entre turnos
+- El pool del cliente async queda ligado al event loop que lo usa: quien lo usa dentro de un
+  asyncio.run debe llamar a cerrar_async_groq al terminar
+- KEEPALIVE amplia los 5 s que httpx mantiene una conexion ociosa, para que sobreviva a la pausa
+  entre turnos (TTS, lectura) y al precalentamiento que hace server.py al arrancar
+"""
+
+import functools
+import os
+
+import httpx
+from dotenv import load_dotenv
+from groq import AsyncGroq, Groq
+
+load_dotenv()
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+# El SDK reintenta 429/5xx/timeouts con backoff exponencial y jitter
+MAX_RETRIES = 3
+TIMEOUT = 60.0  # segundos
+KEEPALIVE = float(os.getenv("GROQ_KEEPALIVE", "120"))  # segundos que una conexion ociosa sigue abierta
+
+
+def _limites() -> httpx.Limits:
+    return httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=KEEPALIVE)
+
+
+@functools.lru_cache(maxsize=1)
+def get_groq() -> Groq:
+    return Groq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=MAX_RETRIES,
+        timeout=TIMEOUT,
+        http_client=httpx.Client(limits=_limites(), timeout=TIMEOUT, follow_redirects=True),
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_async_groq() -> AsyncGroq:
+    return AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        max_retries=MAX_RETRIES,
+        timeout=TIMEOUT,
+        http_client=httpx.AsyncClient(limits=_limites(), timeout=TIMEOUT, follow_redirects=True),
+    )
+
+
+async def cerrar_async_groq() -> None:
+    # Cierra el cliente async (si se llego a crear) y olvida el singleton: el siguiente event loop
+    # creara uno nuevo en vez de reutilizar conexiones de un loop ya cerrado
+    if get_async_groq.cache_info().currsize:
+        cliente = get_async_groq()
+        get_async_groq.cache_clear()
+        await cliente.close()
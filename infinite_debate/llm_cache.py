@@ -0,0 +1,132 @@
+"""
+llm_cache.py - Cache en disco de respuestas LLM para Infinite Debate
+
+- La clave es el sha256 del JSON canonico de la peticion (modelo, mensajes, temperatura, max_tokens)
+- Se guarda en SQLite bajo ~/.cache/infinite_debate/ (o DEBATE_CACHE_DIR) con expiracion por entrada
+- Util para replays, desarrollo y CI: un acierto evita la llamada de red y su coste en tokens
+- SemanticCache (opcional): reutiliza respuestas de prompts casi identicos via embeddings;
+  requiere sentence-transformers y hnswlib, que solo se importan al instanciarla
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+CACHE_DIR = Path(os.getenv("DEBATE_CACHE_DIR", str(Path.home() / ".cache" / "infinite_debate")))
+EXPIRACION_POR_DEFECTO = 86400  # segundos
+MODELO_EMBEDDINGS = "sentence-transformers/all-MiniLM-L6-v2"
+DIM_EMBEDDINGS = 384
+
+
+def clave_cache(datos: Dict) -> str:
+    crudo = json.dumps(datos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: Optional[Path] = None, expire: int = EXPIRACION_POR_DEFECTO):
+        path = Path(path) if path else CACHE_DIR / "respuestas.sqlite3"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._expire = expire
+        # check_same_thread=False: FastAPI y asyncio.to_thread usan la conexion desde varios hilos;
+        # el lock evita que la lectura de uno se cruce con la transaccion de otro
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            "clave TEXT PRIMARY KEY, contenido TEXT NOT NULL, expira REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, clave: str) -> Optional[str]:
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT contenido, expira FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+        if fila is None or fila[1] < time.time():
+            return None
+        return fila[0]
+
+    def set(self, clave: str, contenido: str, expire: Optional[int] = None) -> None:
+        expira = time.time() + (self._expire if expire is None else expire)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, contenido, expira) VALUES (?, ?, ?)",
+                (clave, contenido, expira),
+            )
+
+    def get_or_call(self, key_dict: Dict, fn: Callable[[], str]) -> str:
+        clave = clave_cache(key_dict)
+        contenido = self.get(clave)
+        if contenido is None:
+            contenido = fn()
+            self.set(clave, contenido)
+        return contenido
+
+
+class SemanticCache:
+    # Intercambia exactitud por velocidad: devuelve la respuesta de un prompt previo con
+    # similitud coseno >= umbral y el mismo system prompt.
+    def __init__(self, path: Optional[Path] = None, umbral: float = 0.92):
+        import hnswlib
+        import numpy as np
+        from sentence_transformers import SentenceTransformer
+
+        self._np = np
+        self._modelo = SentenceTransformer(MODELO_EMBEDDINGS)
+        self._umbral = umbral
+        self._entradas: Dict[int, Tuple[str, str]] = {}  # id -> (hash del system prompt, respuesta)
+        # buscar/guardar pueden llegar desde varios hilos (asyncio.to_thread): el indice no admite
+        # consultas mientras se redimensiona
+        self._lock = threading.Lock()
+
+        path = Path(path) if path else CACHE_DIR / "semantica.sqlite3"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantica ("
+            "id INTEGER PRIMARY KEY, sistema TEXT NOT NULL, prompt TEXT NOT NULL, "
+            "respuesta TEXT NOT NULL, embedding BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+        filas = self._conn.execute("SELECT id, sistema, respuesta, embedding FROM semantica").fetchall()
+        self._index = hnswlib.Index(space="cosine", dim=DIM_EMBEDDINGS)
+        self._index.init_index(max_elements=max(1024, 2 * len(filas)))
+        for id_, sistema, respuesta, embedding in filas:
+            self._index.add_items(np.frombuffer(embedding, dtype=np.float32), id_)
+            self._entradas[id_] = (sistema, respuesta)
+
+    def buscar(self, system_prompt: str, user_prompt: str) -> Tuple[Optional[str], Any]:
+        # Devuelve (respuesta o None, embedding) para reutilizar el embedding en guardar()
+        emb = self._modelo.encode(user_prompt, normalize_embeddings=True).astype(self._np.float32)
+        if not self._entradas:
+            return None, emb
+        sistema = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            labels, distances = self._index.knn_query(emb, k=min(5, len(self._entradas)))
+        for id_, distancia in zip(labels[0], distances[0]):
+            if 1 - distancia < self._umbral:
+                break
+            entrada = self._entradas.get(int(id_))
+            if entrada and entrada[0] == sistema:
+                return entrada[1], emb
+        return None, emb
+
+    def guardar(self, system_prompt: str, user_prompt: str, emb: Any, respuesta: str) -> None:
+        sistema = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO semantica (sistema, prompt, respuesta, embedding) VALUES (?, ?, ?, ?)",
+                (sistema, user_prompt, respuesta, emb.tobytes()),
+            )
+        with self._lock:
+            if self._index.get_current_count() >= self._index.get_max_elements():
+                self._index.resize_index(2 * self._index.get_max_elements())
+            self._index.add_items(emb, cursor.lastrowid)
+            self._entradas[cursor.lastrowid] = (sistema, respuesta)
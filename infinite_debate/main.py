@@ -1,85 +1,169 @@
+import asyncio
+import functools
 import os
-import random
 import re
-from typing import Dict, List, Optional
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
-from groq import Groq
+if not __package__:
+    # Ejecutado como script (python infinite_debate/main.py): el directorio raiz del repo no esta
+    # en sys.path y las importaciones absolutas del paquete fallarian
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from infinite_debate.client import GROQ_MODEL, cerrar_async_groq, get_async_groq, get_groq
+from infinite_debate.llm_cache import LLMCache, SemanticCache, clave_cache
+from infinite_debate.prompts import load_prompt
 
 
 # === Memoria de contexto para el debate ===
+# Cada coleccion es un set acotado con orden LRU (OrderedDict): el texto de evitacion que se
+# inyecta en el prompt no crece con la duracion del debate.
+MEMORIA_MAX_ITEMS = 32
+MEMORIA_ITEMS_VISIBLES = 16
+# Metricas reconocidas en las respuestas: una sola alternacion compilada, un solo recorrido del texto
+_METRIC_RE = re.compile(r"\b(ROE|P/B|PEG|DY|PFS|ROIC|EV/EBITDA)\b", re.IGNORECASE)
+
+
+def extraer_metricas(texto: str) -> List[str]:
+    return list(dict.fromkeys(m.upper() for m in _METRIC_RE.findall(texto)))
+
+
 class MemoriaDebate:
     def __init__(self):
-        self.metricas_buffett = set()
-        self.metricas_cheah = set()
-        self.empresas = set()
-        self.temas = set()
+        self.metricas_buffett = OrderedDict()
+        self.metricas_cheah = OrderedDict()
+        self.empresas = OrderedDict()
+        self.temas = OrderedDict()
+        # Texto de evitacion ya construido por personaje; se invalida en cada registrar_*
+        self._contexto_cache: Dict[str, str] = {}
+
+    def _registrar(self, destino, items):
+        self._contexto_cache.clear()
+        for item in items:
+            destino[item] = None
+            destino.move_to_end(item)
+            if len(destino) > MEMORIA_MAX_ITEMS:
+                destino.popitem(last=False)
+
+    @staticmethod
+    def _recientes(items):
+        return ", ".join(list(items)[-MEMORIA_ITEMS_VISIBLES:])
 
     def registrar_metricas(self, personaje, metricas):
         if personaje == "buffett":
-            self.metricas_buffett.update(metricas)
+            self._registrar(self.metricas_buffett, metricas)
         else:
-            self.metricas_cheah.update(metricas)
+            self._registrar(self.metricas_cheah, metricas)
 
     def registrar_empresas(self, empresas):
-        self.empresas.update(empresas)
+        self._registrar(self.empresas, empresas)
 
     def registrar_tema(self, tema):
-        self.temas.add(tema)
+        self._registrar(self.temas, (tema,))
 
     def obtener_contexto_evitacion(self, personaje):
-        contexto = []
-        if personaje == "buffett" and self.metricas_buffett:
-            contexto.append(
-                f"Evita repetir metricas ya mencionadas: {', '.join(self.metricas_buffett)}."
-            )
-        if personaje == "cheah" and self.metricas_cheah:
-            contexto.append(
-                f"Evita repetir metricas ya mencionadas: {', '.join(self.metricas_cheah)}."
+        contexto = self._contexto_cache.get(personaje)
+        if contexto is None:
+            metricas = {"buffett": self.metricas_buffett, "cheah": self.metricas_cheah}.get(personaje)
+            contexto = " ".join(
+                plantilla.format(self._recientes(items))
+                for plantilla, items in (
+                    ("Evita repetir metricas ya mencionadas: {}.", metricas),
+                    ("Evita repetir empresas ya mencionadas: {}.", self.empresas),
+                    ("Varia el tema, ya se hablo de: {}.", self.temas),
+                )
+                if items
             )
-        if self.empresas:
-            contexto.append(f"Evita repetir empresas ya mencionadas: {', '.join(self.empresas)}.")
-        if self.temas:
-            contexto.append(f"Varia el tema, ya se hablo de: {', '.join(self.temas)}.")
-        return " ".join(contexto)
+            self._contexto_cache[personaje] = contexto
+        return contexto
 
 
 # === Postprocesamiento avanzado ===
+# Patrones compilados una sola vez: el postprocesado corre sobre cada respuesta del LLM
+_RE_WORD_DUP = re.compile(r"(\b\w+\b)(\s+\1\b)+", re.IGNORECASE)
+_RE_PHRASE_DUP = re.compile(r"(\b\w{3,}\b)([^\w\n]+\1\b)+", re.IGNORECASE)
+_RE_MULTI_DOT = re.compile(r"\.{2,}")
+_RE_SPACE_DOT = re.compile(r"\s+\.")
+# Palabras truncadas/partidas por el modelo: una sola alternacion en vez de un re.sub por palabra
+_FIXUPS = {"val": "valor", "co mo": "como", "empres": "empresa", "mercad": "mercado"}
+_FIX_RE = re.compile(r"\b(" + "|".join(map(re.escape, _FIXUPS)) + r")\b")
+_RE_MULTISPACE = re.compile(r"\s{2,}")
+# Fin de oracion: terminador seguido de espacio en blanco (sin lookbehind, que es lo caro)
+_RE_FIN_ORACION = re.compile(r"[.!?]\s+")
+# Una sola pasada de str.translate: saltos de linea y tabuladores a espacio, "*" y vinetas fuera.
+# "-" solo se quita al inicio de linea, con regex y antes de unir las lineas
+_LIMPIAR_TR = str.maketrans({"\n": " ", "\r": " ", "\t": " ", "*": None, "\u2022": None})
+_RE_GUION_LISTA = re.compile(r"(?m)^\s*-+\s+")
+_RE_SENT_TERM = re.compile(r"[.!?]")
+# Mismo criterio de palabra que _RE_WORD_DUP/_RE_PHRASE_DUP: cualquier caracter no \w separa
+_RE_PALABRA = re.compile(r"\w+")
+
+
+def _hay_palabras_repetidas(texto: str) -> bool:
+    palabras = _RE_PALABRA.findall(texto.casefold())
+    return len(set(palabras)) < len(palabras)
+
+
+def _hay_espacio_raro(texto: str) -> bool:
+    # Todo espacio en blanco distinto de " " es no imprimible: cubre cualquier \s{2,} o \s+\.
+    return not texto.isprintable()
+
+
+def _dividir_oraciones(texto: str) -> List[str]:
+    # Equivale a re.split(r"(?<=[.!?])\s+", texto): corta tras el terminador y salta el espacio
+    oraciones = []
+    inicio = 0
+    for m in _RE_FIN_ORACION.finditer(texto):
+        oraciones.append(texto[inicio : m.start() + 1])
+        inicio = m.end()
+    oraciones.append(texto[inicio:])
+    return oraciones
+
+
+def _aplicar_fixups(texto: str) -> str:
+    return _FIX_RE.sub(lambda m: _FIXUPS[m.group(1)], texto)
+
+
 def mejorar_fluidez_texto(texto: str) -> str:
     # Elimina repeticiones de palabras/frases, puntos dobles, cortes bruscos
-    texto = re.sub(r"(\\b\\w+\\b)(\\s+\\1\\b)+", r"\\1", texto, flags=re.IGNORECASE)
-    texto = re.sub(r"(\\b\\w{3,}\\b)([^\\w\\n]+\\1\\b)+", r"\\1", texto, flags=re.IGNORECASE)
-    texto = re.sub(r"\\.{2,}", ".", texto)
-    texto = re.sub(r"\\s+\\.", ".", texto)
-    texto = re.sub(r"\\bval\\b", "valor", texto)
-    texto = re.sub(r"\\bco mo\\b", "como", texto)
-    texto = re.sub(r"\\s{2,}", " ", texto)
+    # Cada regex solo corre si una comprobacion en C indica que puede haber algo que corregir
+    if _hay_palabras_repetidas(texto):
+        texto = _RE_WORD_DUP.sub(r"\1", texto)
+        texto = _RE_PHRASE_DUP.sub(r"\1", texto)
+    if ".." in texto:
+        texto = _RE_MULTI_DOT.sub(".", texto)
+    raro = _hay_espacio_raro(texto)
+    if raro or " ." in texto:
+        texto = _RE_SPACE_DOT.sub(".", texto)
+    texto = _aplicar_fixups(texto)
+    if raro or "  " in texto:
+        texto = _RE_MULTISPACE.sub(" ", texto)
     return texto.strip()
 
 
 def reconstruir_oraciones(texto: str) -> str:
-    texto = re.sub(r"\\bval\\b", "valor", texto)
-    texto = re.sub(r"\\bco mo\\b", "como", texto)
-    texto = re.sub(r"\\bempres\\b", "empresa", texto)
-    texto = re.sub(r"\\bmercad\\b", "mercado", texto)
-    return texto
+    return _aplicar_fixups(texto)
 
 
 def evitar_repeticion(texto: str) -> str:
-    frases = re.split(r"(?<=[.!?])\\s+", texto)
+    # Una sola normalizacion (casefold) por frase; solo se guarda su hash (int), no el string
     vistas = set()
     resultado = []
-    for frase in frases:
-        f = frase.strip().lower()
-        if f and f not in vistas:
-            resultado.append(frase.strip())
-            vistas.add(f)
+    for frase in _dividir_oraciones(texto):
+        frase = frase.strip()
+        if frase:
+            clave = hash(frase.casefold())
+            if clave not in vistas:
+                vistas.add(clave)
+                resultado.append(frase)
     return " ".join(resultado)
 
 
 # === Logica avanzada de formato, longitud, personalidad y bancos de preguntas ===
 REGLA_HINT = (
-    "Recuerda: 2-4 frases, 350-550 caracteres, sin listas ni negritas, "
+    "Recuerda: MINIMO 350 caracteres (maximo 550), EXACTAMENTE 3-4 frases, sin listas ni negritas, "
     "incluye al menos una metrica concreta (p.ej., ROE, P/B, PEG, DY, PFS), "
     "y termina con una sola pregunta."
 )
@@ -90,6 +174,8 @@ def prompt_personaje(personaje_prompt: str) -> str:
 
 
 MIN_LEN, MAX_LEN = 350, 550
+# Holgura para que quepan 550 caracteres en una sola llamada; el streaming corta en MAX_LEN igual
+MAX_TOKENS = 320
 
 PREGUNTAS_BUFFETT = [
     "No crees que estas sobrevalorando el crecimiento frente a la calidad?",
@@ -102,17 +188,46 @@ PREGUNTAS_CHEAH = [
     "Por que sigues buscando analogos occidentales en un rio distinto?",
 ]
 
+# Indice round-robin por personaje: recorre su banco de preguntas en orden, asi que nunca repite
+# la misma pregunta dos turnos seguidos, y no toca el PRNG
+_Q_IDX = {"buffett": 0, "cheah": 0}
+
+
+def _siguiente_pregunta(personaje: str) -> str:
+    clave = "buffett" if personaje == "buffett" else "cheah"
+    pool = PREGUNTAS_BUFFETT if clave == "buffett" else PREGUNTAS_CHEAH
+    idx = _Q_IDX[clave]
+    _Q_IDX[clave] = idx + 1
+    return pool[idx % len(pool)]
+
+
+# Frase de relleno para respuestas que siguen cortas: sustituye a una segunda llamada al LLM.
+# Tambien en round-robin por personaje para no repetir la misma frase en turnos seguidos.
+SUFIJOS_BUFFETT = [
+    "A largo plazo lo que manda es la calidad del negocio y el flujo de caja libre que genera, no el relato del trimestre.",
+    "Prefiero un ROE sostenido por encima del 15% sin apalancamiento excesivo antes que cualquier promesa de crecimiento rapido.",
+    "El margen de seguridad en el precio es lo unico que protege al inversor cuando la tesis resulta estar equivocada.",
+]
+SUFIJOS_CHEAH = [
+    "En Asia el contexto politico forma parte del balance, y un DY estable en empresas estatales refleja ese dividendo politico.",
+    "Un PEG razonable en un mercado que crece a doble digito compensa multiplos que en Occidente parecerian exigentes.",
+    "El PFS ajustado por riesgo regulatorio sigue dejando un margen atractivo en muchas companias asiaticas de calidad.",
+]
+_S_IDX = {"buffett": 0, "cheah": 0}
+
 
 def limpiar_formato(texto: str) -> str:
-    t = re.sub(r"[*\\-]+(\\s+)", " ", texto)
-    t = re.sub(r"\\n+", " ", t)
-    t = re.sub(r"\\s{2,}", " ", t).strip()
-    t = t.replace("**", "")
-    return t
+    t = texto
+    if "-" in t:
+        t = _RE_GUION_LISTA.sub(" ", t)  # antes de unir lineas: necesita los inicios de linea
+    t = t.translate(_LIMPIAR_TR)
+    if "  " in t or _hay_espacio_raro(t):
+        t = _RE_MULTISPACE.sub(" ", t)
+    return t.strip()
 
 
 def limitar_oraciones(texto: str, max_oraciones: int = 4) -> str:
-    oraciones = re.split(r"(?<=[.!?])\\s+", texto)
+    oraciones = _dividir_oraciones(texto)
     if len(oraciones) > max_oraciones:
         texto = " ".join(oraciones[:max_oraciones]).strip()
     return texto
@@ -134,30 +249,111 @@ def recortar_a_rango(texto: str) -> str:
 def asegurar_pregunta(texto: str, personaje: str) -> str:
     t = texto.rstrip()
     if not t.endswith("?"):
-        pool = PREGUNTAS_BUFFETT if personaje == "buffett" else PREGUNTAS_CHEAH
-        t += " " + random.choice(pool)
-    t = re.sub(r"\\?+\\s*$", "?", t)
+        # Las preguntas del banco acaban en un solo "?": no hace falta normalizar la cola
+        return t + " " + _siguiente_pregunta(personaje)
+    if t.endswith("??"):
+        t = t.rstrip("?") + "?"
     return t
 
 
 def es_corto(texto: str) -> bool:
-    oraciones = re.split(r"[.!?]", texto)
-    oraciones = [o.strip() for o in oraciones if o.strip()]
-    return len(texto) < MIN_LEN or len(oraciones) < 2
+    # La longitud es O(1): solo se cuentan oraciones si el texto alcanza MIN_LEN
+    if len(texto) < MIN_LEN:
+        return True
+    oraciones = 0
+    for o in _RE_SENT_TERM.split(texto):
+        if o.strip():
+            oraciones += 1
+            if oraciones >= 2:
+                return False
+    return True
+
+
+def rellenar_si_corto(texto: str, personaje: str, max_oraciones: int = 4) -> str:
+    # Inserta como mucho UNA frase de SUFIJOS_* antes de la pregunta final, sin pasar de
+    # max_oraciones (contando la pregunta) ni de MAX_LEN; si aun asi queda corta, se deja corta
+    if not es_corto(texto):
+        return texto
+    oraciones = _dividir_oraciones(texto)
+    if len(oraciones) >= max_oraciones:
+        return texto
+    clave = "buffett" if personaje == "buffett" else "cheah"
+    pool = SUFIJOS_BUFFETT if clave == "buffett" else SUFIJOS_CHEAH
+    for _ in range(len(pool)):
+        sufijo = pool[_S_IDX[clave] % len(pool)]
+        _S_IDX[clave] += 1
+        if sufijo not in texto:
+            break
+    else:
+        return texto
+    pregunta = oraciones.pop() if oraciones[-1].endswith("?") else ""
+    candidato = " ".join(oraciones + [sufijo, pregunta]).strip()
+    return candidato if len(candidato) <= MAX_LEN else texto
 
 
-def postprocesar(texto: str, personaje: str) -> str:
+def postprocesar(texto: str, personaje: str, max_oraciones: int = 4) -> str:
+    # Mismo resultado que limpiar_formato -> limitar_oraciones -> recortar_a_rango -> asegurar_pregunta,
+    # pero dividiendo en oraciones una sola vez y sin strings intermedios innecesarios:
+    # solo se unen las oraciones que caen antes de MAX_LEN y solo se busca corte si se supera.
+    # Al final, rellenar_si_corto anade como mucho una frase a las respuestas cortas, sin otra llamada al LLM.
     t = limpiar_formato(texto)
-    t = limitar_oraciones(t, max_oraciones=4)
-    t = recortar_a_rango(t)
-    t = asegurar_pregunta(t, personaje)
-    return t
+    oraciones = _dividir_oraciones(t)
+    if len(oraciones) > max_oraciones:
+        partes: List[str] = []
+        largo = -1  # el primer separador no cuenta
+        for oracion in oraciones[:max_oraciones]:
+            partes.append(oracion)
+            largo += len(oracion) + 1
+            if largo > MAX_LEN:
+                break  # recortar_a_rango descartaria el resto de todas formas
+        t = " ".join(partes).strip()
+    if len(t) > MAX_LEN:
+        t = recortar_a_rango(t)
+    return rellenar_si_corto(asegurar_pregunta(t, personaje), personaje, max_oraciones)
 
 
 # === Integracion con Groq ===
-load_dotenv()
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Cache en disco: siempre con temperature == 0; con DEBATE_CACHE=1 tambien para replays no deterministas
+DEBATE_CACHE = os.getenv("DEBATE_CACHE") == "1"
+# Cache semantica (embeddings + hnswlib): opt-in porque sacrifica exactitud por velocidad
+DEBATE_SEMANTIC_CACHE = os.getenv("DEBATE_SEMANTIC_CACHE") == "1"
+
+
+@functools.lru_cache(maxsize=1)
+def _obtener_cache() -> LLMCache:
+    return LLMCache()
+
+
+@functools.lru_cache(maxsize=1)
+def _obtener_cache_semantica() -> SemanticCache:
+    return SemanticCache()
+
+
+# La primera llamada puede llegar a la vez desde varios hilos: el modelo se carga una sola vez
+_CACHE_SEMANTICA_LOCK = threading.Lock()
+
+
+def _cache_semantica_para(history: Optional[List[Dict]]) -> Optional[SemanticCache]:
+    # Con historial el contexto real difiere aunque el ultimo prompt se parezca
+    if DEBATE_SEMANTIC_CACHE and not history:
+        with _CACHE_SEMANTICA_LOCK:
+            return _obtener_cache_semantica()
+    return None
+
+
+def _cache_para(temperature: float) -> Optional[LLMCache]:
+    if temperature == 0 or DEBATE_CACHE:
+        return _obtener_cache()
+    return None
+
+
+def _datos_cache(mensajes: List[Dict[str, str]], temperature: float, max_tokens: int) -> Dict:
+    return {
+        "model": GROQ_MODEL,
+        "messages": mensajes,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
 
 
 def _construir_mensajes(system_prompt: str, user_prompt: str, history: Optional[List[Dict]]) -> List[Dict[str, str]]:
@@ -165,98 +361,300 @@ def _construir_mensajes(system_prompt: str, user_prompt: str, history: Optional[
         {"role": "system", "content": system_prompt},
     ]
     if history:
-        mensajes.extend(history)
+        # Un mensaje repetido literalmente se sustituye por una referencia a su primera aparicion
+        # (numerada por mensaje del historial): menos tokens de prefill, y como el historial solo
+        # crece, el prefijo sigue siendo estable. Solo se deduplican contenidos de texto no vacios;
+        # el contenido multiparte (lista) o vacio pasa tal cual.
+        vistos: Dict[str, int] = {}
+        for numero, mensaje in enumerate(history, 1):
+            contenido = mensaje.get("content")
+            if isinstance(contenido, str) and contenido:
+                primero = vistos.setdefault(contenido, numero)
+                if primero != numero:
+                    mensaje = {**mensaje, "content": f"[ver mensaje {primero}]"}
+            mensajes.append(mensaje)
     mensajes.append({"role": "user", "content": user_prompt})
     return mensajes
 
 
-def _llamar_groq(
-    system_prompt: str,
-    user_prompt: str,
-    temperature: float,
-    max_tokens: int,
-    history: Optional[List[Dict]] = None,
+def _delta(chunk) -> str:
+    if not chunk.choices or not chunk.choices[0].delta:
+        return ""
+    return chunk.choices[0].delta.content or ""
+
+
+def _suficiente(texto: str) -> bool:
+    # postprocesar recorta a MAX_LEN y a 4 oraciones: lo que llegue despues se descartaria igual.
+    # Una quinta "oracion" (aunque vacia) indica que ya hay 4 completas. Por debajo de MIN_LEN se
+    # sigue leyendo: cortar ahi dejaria una respuesta corta que habria que rellenar.
+    # Los umbrales se miden sobre el texto ya limpio, como en postprocesar: si no, un "**" haria
+    # cortar antes de que recortar_a_rango tenga un terminador en el que apoyarse.
+    if len(texto) < MIN_LEN:
+        return False  # limpiar_formato nunca alarga el texto
+    t = limpiar_formato(texto)
+    if len(t) > MAX_LEN:
+        return True
+    return len(t) >= MIN_LEN and len(_dividir_oraciones(t)) > 4
+
+
+def _validar_contenido(partes: List[str]) -> str:
+    contenido = "".join(partes).strip()
+    if not contenido:
+        raise RuntimeError("Groq devolvio una respuesta vacia.")
+    return contenido
+
+
+def _completar_groq(mensajes: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    # En streaming: se corta la generacion en cuanto hay texto suficiente y se ahorran tokens
+    partes: List[str] = []
+    try:
+        stream = get_groq().chat.completions.create(
+            model=GROQ_MODEL,
+            messages=mensajes,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            presence_penalty=0.2,
+            frequency_penalty=0.2,
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                delta = _delta(chunk)
+                if delta:
+                    partes.append(delta)
+                    if _suficiente("".join(partes)):
+                        break
+        finally:
+            stream.close()
+    except Exception as exc:  # noqa: BLE001
+        raise RuntimeError(f"Fallo al llamar a Groq: {exc}") from exc
+
+    return _validar_contenido(partes)
+
+
+async def _completar_groq_async(
+    mensajes: List[Dict[str, str]], temperature: float, max_tokens: int
 ) -> str:
-    mensajes = _construir_mensajes(system_prompt, user_prompt, history)
+    partes: List[str] = []
     try:
-        respuesta = client.chat.completions.create(
+        stream = await get_async_groq().chat.completions.create(
             model=GROQ_MODEL,
             messages=mensajes,
             temperature=temperature,
             max_tokens=max_tokens,
             presence_penalty=0.2,
             frequency_penalty=0.2,
+            stream=True,
         )
+        try:
+            async for chunk in stream:
+                delta = _delta(chunk)
+                if delta:
+                    partes.append(delta)
+                    if _suficiente("".join(partes)):
+                        break
+        finally:
+            await stream.close()
     except Exception as exc:  # noqa: BLE001
         raise RuntimeError(f"Fallo al llamar a Groq: {exc}") from exc
 
-    if not respuesta.choices:
-        raise RuntimeError("Groq no devolvio opciones de respuesta.")
+    return _validar_contenido(partes)
 
-    contenido = respuesta.choices[0].message.content if respuesta.choices[0].message else None
-    if not contenido or not contenido.strip():
-        raise RuntimeError("Groq devolvio una respuesta vacia.")
-    return contenido.strip()
 
+def _llamar_groq(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    history: Optional[List[Dict]] = None,
+    texto_semantico: Optional[str] = None,
+) -> str:
+    # texto_semantico es lo que se embebe en la cache semantica (por defecto user_prompt). Conviene
+    # pasar solo el mensaje rival: el prefijo fijo REGLAS_TURNO acercaria mensajes sin relacion.
+    mensajes = _construir_mensajes(system_prompt, user_prompt, history)
+    texto_semantico = user_prompt if texto_semantico is None else texto_semantico
+    semantica = _cache_semantica_para(history)
+    if semantica is not None:
+        acierto, emb = semantica.buscar(system_prompt, texto_semantico)
+        if acierto is not None:
+            return acierto
+
+    cache = _cache_para(temperature)
+    if cache is None:
+        contenido = _completar_groq(mensajes, temperature, max_tokens)
+    else:
+        contenido = cache.get_or_call(
+            _datos_cache(mensajes, temperature, max_tokens),
+            lambda: _completar_groq(mensajes, temperature, max_tokens),
+        )
 
-def generar_respuesta(personaje_prompt, mensaje, personaje, history: Optional[List[Dict]] = None):
-    msg_ctx = (
-        "Debate Oriente vs Occidente. Responde con tu personalidad y principios. "
-        "Incluye al menos una metrica concreta (ROE, P/B, flujo de caja; o PEG, DY, PFS). "
-        "Sin bullets ni negritas. Cierra con una sola pregunta.\n\n"
-        f'Mensaje del otro inversor: "{mensaje}"'
-    )
+    if semantica is not None:
+        semantica.guardar(system_prompt, texto_semantico, emb, contenido)
+    return contenido
 
-    temp = 0.7 if personaje == "buffett" else 0.8
 
+async def _llamar_groq_async(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    history: Optional[List[Dict]] = None,
+    texto_semantico: Optional[str] = None,
+) -> str:
+    # Cargar el modelo de embeddings, codificar y escribir en SQLite bloquean: van a un hilo para
+    # no frenar los /turn concurrentes
+    mensajes = _construir_mensajes(system_prompt, user_prompt, history)
+    texto_semantico = user_prompt if texto_semantico is None else texto_semantico
+    semantica = await asyncio.to_thread(_cache_semantica_para, history) if DEBATE_SEMANTIC_CACHE else None
+    if semantica is not None:
+        acierto, emb = await asyncio.to_thread(semantica.buscar, system_prompt, texto_semantico)
+        if acierto is not None:
+            return acierto
+
+    # Igual con la cache exacta: abrir SQLite, leer y confirmar escrituras tambien bloquean
+    cache = await asyncio.to_thread(_cache_para, temperature) if temperature == 0 or DEBATE_CACHE else None
+    if cache is None:
+        contenido = await _completar_groq_async(mensajes, temperature, max_tokens)
+    else:
+        clave = clave_cache(_datos_cache(mensajes, temperature, max_tokens))
+        contenido = await asyncio.to_thread(cache.get, clave)
+        if contenido is None:
+            contenido = await _completar_groq_async(mensajes, temperature, max_tokens)
+            await asyncio.to_thread(cache.set, clave, contenido)
+
+    if semantica is not None:
+        await asyncio.to_thread(semantica.guardar, system_prompt, texto_semantico, emb, contenido)
+    return contenido
+
+
+# Parte fija del mensaje de usuario. Todo lo dinamico (mensaje rival, pistas de MemoriaDebate,
+# instrucciones por turno) va siempre al final para que el prefijo system + reglas sea identico entre turnos
+# y el proveedor pueda reutilizar su cache de prefijo.
+REGLAS_TURNO = (
+    "Debate Oriente vs Occidente. Responde con tu personalidad y principios. "
+    "Incluye al menos una metrica concreta (ROE, P/B, flujo de caja; o PEG, DY, PFS). "
+    "Sin bullets ni negritas. Cierra con una sola pregunta.\n\n"
+)
+
+
+def _mensaje_contexto(mensaje: str, evitacion: str = "") -> str:
+    msg_ctx = REGLAS_TURNO + f'Mensaje del otro inversor: "{mensaje}"'
+    if evitacion:
+        msg_ctx += "\n\n" + evitacion
+    return msg_ctx
+
+
+def _temperatura(personaje: str) -> float:
+    return 0.7 if personaje == "buffett" else 0.8
+
+
+def generar_respuesta(
+    system_prompt, mensaje, personaje, history: Optional[List[Dict]] = None, evitacion: str = ""
+):
+    # Una sola llamada: REGLA_HINT exige la longitud y, si aun asi queda corta,
+    # postprocesar la rellena con SUFIJOS_* en vez de pedir al modelo que amplie
     texto = _llamar_groq(
-        prompt_personaje(personaje_prompt),
-        msg_ctx,
-        temperature=temp,
-        max_tokens=220,
+        system_prompt,
+        _mensaje_contexto(mensaje, evitacion),
+        temperature=_temperatura(personaje),
+        max_tokens=MAX_TOKENS,
         history=history,
+        texto_semantico=mensaje,
     )
+    return postprocesar(texto, personaje)
 
-    if es_corto(texto):
-        try:
-            texto = _llamar_groq(
-                prompt_personaje(personaje_prompt),
-                msg_ctx + "\n\nAmplia en 1-2 frases mas y cierra con una sola pregunta.",
-                temperature=temp,
-                max_tokens=220,
-                history=history,
-            )
-        except RuntimeError:
-            pass
 
+async def generar_respuesta_async(
+    system_prompt, mensaje, personaje, history: Optional[List[Dict]] = None, evitacion: str = ""
+):
+    # Igual que generar_respuesta pero sin bloquear el event loop (FastAPI, debates en paralelo)
+    texto = await _llamar_groq_async(
+        system_prompt,
+        _mensaje_contexto(mensaje, evitacion),
+        temperature=_temperatura(personaje),
+        max_tokens=MAX_TOKENS,
+        history=history,
+        texto_semantico=mensaje,
+    )
     return postprocesar(texto, personaje)
 
 
-# Leer prompts base
-script_dir = os.path.dirname(os.path.abspath(__file__))
-with open(os.path.join(script_dir, "buffett.txt"), "r", encoding="utf-8") as f:
-    buffett_prompt = f.read()
+# Prompts base (leidos y cacheados por infinite_debate.prompts)
+buffett_prompt = load_prompt("buffett")
+cheah_prompt = load_prompt("cheah")
 
-with open(os.path.join(script_dir, "cheah.txt"), "r", encoding="utf-8") as f:
-    cheah_prompt = f.read()
+# System prompts finales (persona + REGLA_HINT) construidos una vez: el mismo string, byte a byte,
+# en todos los turnos para que el prefijo cacheable del proveedor no cambie.
+BUFFETT_SYSTEM = prompt_personaje(buffett_prompt)
+CHEAH_SYSTEM = prompt_personaje(cheah_prompt)
+SYS_PROMPTS = {"buffett": BUFFETT_SYSTEM, "cheah": CHEAH_SYSTEM}
+
+
+MENSAJE_INICIAL = (
+    "Warren, tu busqueda de negocios simples funciona en mercados maduros; "
+    "en Asia, la calidad incluye guoqing (situacion nacional) y hongli (dividendo politico). "
+    "Si el PEG esta por debajo de 1.5 y el PFS es alto, no merece una prima?"
+)
+
+
+def _mostrar_replica(turno: int, personaje: str, texto: str) -> None:
+    if personaje == "buffett":
+        print(f"\n{'=' * 50}\n*** TURNO {turno + 1} ***\n{'=' * 50}")
+    print(f"{personaje.upper()}: {texto}")
 
 
 def debate(turnos=3):
-    mensaje = (
-        "Warren, tu busqueda de negocios simples funciona en mercados maduros; "
-        "en Asia, la calidad incluye guoqing (situacion nacional) y hongli (dividendo politico). "
-        "Si el PEG esta por debajo de 1.5 y el PFS es alto, no merece una prima?"
-    )
+    # El CLI usa el mismo camino async que el servidor (cliente pooled)
     print("*** DEBATE INICIAL ***")
-    print(f"Cheah: {mensaje}")
+    print(f"Cheah: {MENSAJE_INICIAL}")
+    asyncio.run(_debate_cli(turnos))
+
 
+async def _debate_cli(turnos: int) -> None:
+    # Cada asyncio.run es un event loop nuevo: el cliente async se cierra al terminar para que una
+    # segunda llamada a debate() (REPL, notebook) no reutilice conexiones del loop anterior
+    try:
+        await debate_async(MENSAJE_INICIAL, turnos, al_responder=_mostrar_replica)
+    finally:
+        await cerrar_async_groq()
+
+
+async def debate_async(
+    mensaje: str = MENSAJE_INICIAL,
+    turnos: int = 3,
+    al_responder: Optional[Callable[[int, str, str], None]] = None,
+) -> List[Tuple[str, str]]:
+    # Dentro de un debate los turnos siguen siendo secuenciales: cada replica depende de la anterior.
+    transcripcion = [("cheah", mensaje)]
+    memoria = MemoriaDebate()
+    memoria.registrar_metricas("cheah", extraer_metricas(mensaje))
     for i in range(turnos):
-        print(f"\n{'=' * 50}\n*** TURNO {i + 1} ***\n{'=' * 50}")
-        buffett_respuesta = generar_respuesta(buffett_prompt, mensaje, "buffett")
-        print(f"BUFFETT: {buffett_respuesta}")
-        cheah_respuesta = generar_respuesta(cheah_prompt, buffett_respuesta, "cheah")
-        print(f"CHEAH: {cheah_respuesta}")
+        buffett_respuesta = await generar_respuesta_async(
+            BUFFETT_SYSTEM, mensaje, "buffett", evitacion=memoria.obtener_contexto_evitacion("buffett")
+        )
+        memoria.registrar_metricas("buffett", extraer_metricas(buffett_respuesta))
+        transcripcion.append(("buffett", buffett_respuesta))
+        if al_responder:
+            al_responder(i, "buffett", buffett_respuesta)
+        cheah_respuesta = await generar_respuesta_async(
+            CHEAH_SYSTEM, buffett_respuesta, "cheah", evitacion=memoria.obtener_contexto_evitacion("cheah")
+        )
+        memoria.registrar_metricas("cheah", extraer_metricas(cheah_respuesta))
+        transcripcion.append(("cheah", cheah_respuesta))
+        if al_responder:
+            al_responder(i, "cheah", cheah_respuesta)
         mensaje = cheah_respuesta
+    return transcripcion
+
+
+async def debates_en_paralelo(mensajes: List[str], turnos: int = 3) -> List[List[Tuple[str, str]]]:
+    # Debates independientes (p.ej. un tema por debate) se solapan en red con asyncio.gather.
+    # Pensado como corrutina principal de un asyncio.run: como en _debate_cli, cierra el cliente
+    # async al terminar. Dentro de un loop que sigue vivo (p.ej. el servidor), usar debate_async.
+    try:
+        return await asyncio.gather(*(debate_async(m, turnos) for m in mensajes))
+    finally:
+        await cerrar_async_groq()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,15 @@
+"""
+prompts.py - Prompts de personaje para Infinite Debate
+
+- Cada prompt se lee de <nombre>.txt junto a este modulo una sola vez y queda en cache
+"""
+
+import functools
+from pathlib import Path
+
+PROMPTS_DIR = Path(__file__).parent
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt(name: str) -> str:
+    return (PROMPTS_DIR / f"{name}.txt").read_text(encoding="utf-8")
@@ -3,31 +3,79 @@ server.py - Backend FastAPI para Infinite Debate
 
 Endpoints:
 - POST /turn: genera respuesta de Buffett o Cheah usando la logica avanzada de main.py
-- GET /seed: devuelve un tema inicial aleatorio
+- GET /seed: devuelve un tema inicial (orden barajado al arrancar, en ciclo)
 - (Opcional) /tts: placeholder para TTS real (Deepgram) o fallback a Web Speech API en frontend
 
 Notas:
 - La clase MemoriaDebate se instancia por sesion (simple para demo, global para prototipo)
 - Habilita CORS para http://localhost:5173
+- Al arrancar abre en segundo plano la conexion con Groq y la re-sondea cada KEEPALIVE/2 s
+  (minimo INTERVALO_MINIMO_SONDEO) para que el primer /turn y los que llegan tras una pausa
+  no paguen el handshake TLS
 - Ver comentarios para enlaces a Deepgram y referencias de Infinite Conversation
 """
 
+import asyncio
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uuid
 import random
 import os
+import hashlib
+from collections import OrderedDict, deque
+from typing import Optional, Tuple
+from infinite_debate.client import KEEPALIVE, cerrar_async_groq, get_async_groq
 from infinite_debate.main import (
-    generar_respuesta,  # O reemplazar por generar_respuesta_mejorada si la implementas
-    buffett_prompt,
-    cheah_prompt,
-    MemoriaDebate
+    generar_respuesta_async,
+    SYS_PROMPTS,
+    MemoriaDebate,
+    extraer_metricas,
 )
 
+# === Precalentamiento de la conexion con Groq ===
+# Groq es una API alojada: no hay modelo que cargar (keep_alive de Ollama no aplica), pero si
+# una conexion TLS. models.list() no consume tokens y deja la conexion en el pool compartido.
+INTERVALO_MINIMO_SONDEO = 10.0  # segundos; evita un bucle continuo con GROQ_KEEPALIVE muy bajo
+_aviso_mostrado = False
+
+
+async def precalentar() -> None:
+    global _aviso_mostrado
+    try:
+        await get_async_groq().models.list()
+    except Exception as exc:  # sin clave o sin red el servidor debe funcionar igual
+        if not _aviso_mostrado:  # un solo aviso, no uno por sondeo
+            _aviso_mostrado = True
+            print(f"Aviso: no se pudo precalentar la conexion con Groq: {exc}")
+
+
+async def mantener_conexion() -> None:
+    await precalentar()
+    if KEEPALIVE <= 0:
+        return  # sin keep-alive no hay conexion ociosa que conservar
+    intervalo = max(KEEPALIVE / 2, INTERVALO_MINIMO_SONDEO)
+    while True:
+        await asyncio.sleep(intervalo)
+        await precalentar()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # En segundo plano: con Groq inalcanzable, precalentar tardaria TIMEOUT x (1 + MAX_RETRIES)
+    # y el servidor no atenderia peticiones hasta entonces
+    tarea = asyncio.create_task(mantener_conexion())
+    try:
+        yield
+    finally:
+        tarea.cancel()
+        await cerrar_async_groq()
+
+
 # === Configuracion FastAPI ===
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
@@ -36,8 +84,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# === Memoria global (para demo, ideal: por usuario/sesion) ===
+# === Memoria por sesion ===
+# Cada session_id tiene su propia MemoriaDebate para que sesiones concurrentes no se mezclen;
+# se conservan las MAX_SESIONES mas recientes. Sin session_id se usa la memoria global.
+MAX_SESIONES = 256
 memoria = MemoriaDebate()
+memorias: "OrderedDict[str, MemoriaDebate]" = OrderedDict()
+
+
+def obtener_memoria(session_id: Optional[str]) -> MemoriaDebate:
+    if not session_id:
+        return memoria
+    mem = memorias.get(session_id)
+    if mem is None:
+        mem = memorias[session_id] = MemoriaDebate()
+        if len(memorias) > MAX_SESIONES:
+            memorias.popitem(last=False)
+    else:
+        memorias.move_to_end(session_id)
+    return mem
+
+# === Cache de respuestas de /turn ===
+# Clave (session_id, speaker, blake2b(message)): un reintento o un bucle del debate con la misma
+# entrada no regenera. La sesion forma parte de la clave porque la respuesta depende de la pista de
+# evitacion de su MemoriaDebate. Se guarda siempre, pero solo se lee con ?cache=1 porque la
+# temperatura es > 0.
+MAX_RESPUESTAS_CACHE = 256
+respuestas_cache: "OrderedDict[Tuple[str, str, bytes], str]" = OrderedDict()
+
+
+def clave_turno(session_id: Optional[str], speaker: str, message: str) -> Tuple[str, str, bytes]:
+    return session_id or "", speaker, hashlib.blake2b(message.encode("utf-8"), digest_size=8).digest()
+
 
 # === Seeds de temas ===
 TOPICS = [
@@ -54,27 +132,50 @@ TOPICS = [
     "Dividendos politicos y su impacto",
     "Gestion de riesgo en mercados volatiles"
 ]
+# Orden barajado una vez al arrancar y recorrido en ciclo: visitantes consecutivos no repiten tema.
+# Sin lock: popleft/append no ceden el event loop entre medias.
+_TOPIC_QUEUE = deque(random.sample(TOPICS, len(TOPICS)))
 
 class TurnRequest(BaseModel):
     speaker: str  # "buffett" o "cheah"
     message: str
+    session_id: Optional[str] = None
+
+# Modelos de respuesta: con ellos FastAPI serializa directamente a bytes JSON con pydantic-core,
+# sin pasar por jsonable_encoder ni json.dumps
+class TurnResponse(BaseModel):
+    text: str
+    audioUrl: str
+
+class SeedResponse(BaseModel):
+    seed: str
 
-@app.post("/turn")
-async def turn(req: TurnRequest):
-    # Selecciona prompt y personaje
-    if req.speaker == "buffett":
-        prompt = buffett_prompt
+@app.post("/turn", response_model=TurnResponse)
+async def turn(req: TurnRequest, cache: bool = False):
+    clave = clave_turno(req.session_id, req.speaker, req.message)
+    respuesta = respuestas_cache.get(clave) if cache else None
+    if respuesta is not None:
+        respuestas_cache.move_to_end(clave)
     else:
-        prompt = cheah_prompt
-    # Llama a la funcion de generacion avanzada
-    respuesta = generar_respuesta(prompt, req.message, req.speaker)
+        # Selecciona el system prompt precalculado del personaje (Cheah por defecto)
+        prompt = SYS_PROMPTS.get(req.speaker, SYS_PROMPTS["cheah"])
+        # Llama a la funcion de generacion avanzada sin bloquear el event loop
+        mem = obtener_memoria(req.session_id)
+        respuesta = await generar_respuesta_async(
+            prompt, req.message, req.speaker, evitacion=mem.obtener_contexto_evitacion(req.speaker)
+        )
+        mem.registrar_metricas(req.speaker, extraer_metricas(respuesta))
+        respuestas_cache[clave] = respuesta
+        if len(respuestas_cache) > MAX_RESPUESTAS_CACHE:
+            respuestas_cache.popitem(last=False)
     # (Opcional) Generar audio con TTS real aqui y guardar como /tts/{uuid}.mp3
     audio_url = f"/tts/{uuid.uuid4()}.mp3"  # Placeholder
     return {"text": respuesta, "audioUrl": audio_url}
 
-@app.get("/seed")
+@app.get("/seed", response_model=SeedResponse)
 async def seed():
-    tema = random.choice(TOPICS)
+    tema = _TOPIC_QUEUE.popleft()
+    _TOPIC_QUEUE.append(tema)
     return {"seed": tema}
 
 # (Opcional) Endpoint para TTS real
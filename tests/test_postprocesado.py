@@ -0,0 +1,89 @@
+import random
+import re
+
+import pytest
+
+import infinite_debate.main as m
+
+RESPUESTA_BUFFETT = (
+    "El **ROE** de una empresa solo me dice algo si se sostiene durante una decada sin apalancamiento "
+    "excesivo, y en muchas companias chinas ese historial simplemente no existe todavia. Prefiero pagar "
+    "un precio justo por un negocio extraordinario que un precio barato por uno mediocre, y un P/B bajo "
+    "no compensa la falta de transparencia contable ni la dilucion constante de los minoritarios. Cuando "
+    "miro el flujo de caja libre de una empresa estatal veo capital asignado con criterios politicos, no "
+    "con el interes del accionista en mente, porque cuyo accionista mayoritario es el propio Estado que "
+    "fija las reglas. Un margen de seguridad real exige entender los numeros y confiar en quien los reporta."
+)
+
+
+# Fragmentos para generar respuestas sinteticas: terminadores, espacios raros, formato y repeticiones
+FRAGMENTOS = [
+    "El ROE", "es alto", "PEG", "hola", "Hola", "mercado", ".", "?", "!", "..", " ", "  ", "\n",
+    "\t", "- ", "\n- ", "**", "\u2022 ", "3.5", "valor", "empresa", "No crees", "que",
+]
+
+
+def _textos_aleatorios(n, semilla=20, max_fragmentos=60):
+    rnd = random.Random(semilla)
+    for _ in range(n):
+        yield "".join(rnd.choice(FRAGMENTOS) for _ in range(rnd.randint(0, max_fragmentos)))
+
+
+@pytest.fixture(autouse=True)
+def indices_a_cero(monkeypatch):
+    # Las preguntas y los sufijos rotan: cada comparacion parte del mismo punto
+    monkeypatch.setattr(m, "_Q_IDX", {"buffett": 0, "cheah": 0})
+    monkeypatch.setattr(m, "_S_IDX", {"buffett": 0, "cheah": 0})
+
+
+def _postprocesar(texto, personaje):
+    m._Q_IDX.update(buffett=0, cheah=0)
+    m._S_IDX.update(buffett=0, cheah=0)
+    return m.postprocesar(texto, personaje)
+
+
+def _cortar_como_stream(texto, paso):
+    # Reproduce el bucle de _completar_groq: acumula deltas y para en cuanto _suficiente lo permite
+    partes = []
+    for i in range(0, len(texto), paso):
+        partes.append(texto[i : i + paso])
+        if m._suficiente("".join(partes)):
+            break
+    return "".join(partes)
+
+
+@pytest.mark.parametrize("paso", [1, 3, 7, 16])
+def test_corte_del_stream_no_cambia_postprocesar(paso):
+    cortado = _cortar_como_stream(RESPUESTA_BUFFETT, paso)
+    assert len(cortado) < len(RESPUESTA_BUFFETT)
+    assert _postprocesar(cortado, "buffett") == _postprocesar(RESPUESTA_BUFFETT, "buffett")
+
+
+@pytest.mark.parametrize(
+    "texto, esperado",
+    [
+        ("hola hola mundo", "hola mundo"),
+        ("Hola hola mundo", "Hola mundo"),
+        ("hola\u20achola", "hola"),
+    ],
+)
+def test_mejorar_fluidez_quita_palabras_repetidas(texto, esperado):
+    assert m.mejorar_fluidez_texto(texto) == esperado
+
+
+def test_dividir_oraciones_equivale_a_re_split():
+    for texto in _textos_aleatorios(5000):
+        assert m._dividir_oraciones(texto) == re.split(r"(?<=[.!?])\s+", texto)
+
+
+def test_postprocesar_equivale_a_la_cadena_de_pasos():
+    for texto in _textos_aleatorios(3000, max_fragmentos=200):
+        for personaje in ("buffett", "cheah"):
+            m._Q_IDX.update(buffett=0, cheah=0)
+            m._S_IDX.update(buffett=0, cheah=0)
+            t = m.limpiar_formato(texto)
+            t = m.limitar_oraciones(t)
+            t = m.recortar_a_rango(t)
+            t = m.asegurar_pregunta(t, personaje)
+            esperado = m.rellenar_si_corto(t, personaje)
+            assert _postprocesar(texto, personaje) == esperado